@@ -7,21 +7,58 @@ Original development by Dave Hardwick
 """
 from enum import Enum
 import os.path
-import sys
 import math
 import signal
+import io
 import threading
 import queue
+from collections import deque
 import logging
 import time
-import codecs
+import csv
 import numpy as np
-import pandas as pd
+import ftplib
 from ftplib import FTP
 from datetime import datetime, timezone
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional - without it the window frequency kernel below simply runs as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
 
-DATE_TIME_FORMAT: str = "%Y-%m-%d %H:%M:%S.%f"
 VERSION: str = "0.3.4"
+# period (seconds) covered by each all events file
+ALL_LOG_FILE_PERIOD: int = 3600
+
+
+# explicit signature makes the kernel compile (or load from cache) at import rather than on the first event
+@njit("float64(int64[::1], int64[::1], int64, int64, int64)", cache=True)
+def _window_frequency(arduino_time_col, dead_time_col, first_index, last_index, window_size):
+    """Calculate the event frequency (Hz) of the window of events running from first_index to last_index."""
+    # live time (arduino time less dead time) only ever increases so only the window end points are needed
+    live_time = (arduino_time_col[last_index] - dead_time_col[last_index]) - \
+                (arduino_time_col[first_index] - dead_time_col[first_index])
+    if live_time == 0:
+        # guarded as numba raises ZeroDivisionError where numpy (without numba) gives inf
+        return np.inf
+    return window_size / (live_time / 1000.0)
+
+
+# character positions kept from an ISO 8601 millisecond time (YYYY-MM-DDTHH:MM:SS.fff) to give YYYYMMDDTHHMMSS.fff
+_COMP_TIME_ISO_CHARS = [0, 1, 2, 3, 5, 6, 8, 9, 10, 11, 12, 14, 15, 17, 18, 19, 20, 21, 22]
+
+
+def _format_comp_time(comp_time_ns: np.ndarray) -> np.ndarray:
+    """Format UTC nanosecond times as strings of the form "%Y%m%d %H%M%S.%f" truncated to milliseconds. The strings
+    are cut from numpy's ISO formatting as a block of characters rather than formatted one at a time by strftime."""
+    iso = np.datetime_as_string(comp_time_ns.view('datetime64[ns]'), unit='ms').astype('U23')
+    # fancy indexing gives a non-contiguous result which must be made contiguous to view rows as strings
+    chars = np.ascontiguousarray(iso.view('U1').reshape(-1, 23)[:, _COMP_TIME_ISO_CHARS])
+    chars[:, 8] = ' '
+    return chars.view('U19').ravel()
 
 
 class Status(Enum):
@@ -29,6 +66,58 @@ class Status(Enum):
     MEDIAN_FREQUENCY_EXCEEDED = 2
 
 
+class SPSCQueue:
+    """Single producer, single consumer queue held in a fixed size ring.
+    Only the producer moves the tail and only the consumer moves the head, so with each index stored by a single
+    thread no lock is needed. Items the consumer wants to retry are held on a separate consumer-only list via requeue()
+    rather than being put back into the ring, which would make the consumer a second producer."""
+    def __init__(self, size: int = 128):
+        """
+        Constructor.
+        :param size: Number of ring slots. The queue holds at most size - 1 items from the producer.
+        """
+        self._buf = [None] * size
+        self._size = size
+        self._head = 0
+        self._tail = 0
+        self._requeued = deque()
+        self._not_empty = threading.Event()
+
+    def empty(self) -> bool:
+        return self._head == self._tail and not self._requeued
+
+    def put(self, item) -> bool:
+        """Add an item (producer only). Returns False without blocking if the ring is full."""
+        tail = self._tail
+        next_tail = (tail + 1) % self._size
+        if next_tail == self._head:
+            return False
+        self._buf[tail] = item
+        self._tail = next_tail
+        self._not_empty.set()
+        return True
+
+    def requeue(self, item) -> None:
+        """Add an item to be retried by the consumer (consumer only)."""
+        self._requeued.append(item)
+
+    def get(self, timeout: float = None):
+        """Remove and return the next item (consumer only), waiting up to timeout seconds for one to arrive. Raises
+        queue.Empty if the wait times out. Requeued items are returned before new items from the ring."""
+        while self.empty():
+            self._not_empty.clear()
+            # re-check after clearing in case the producer added an item in between
+            if self.empty() and not self._not_empty.wait(timeout) and self.empty():
+                raise queue.Empty
+        if self._requeued:
+            return self._requeued.popleft()
+        head = self._head
+        item = self._buf[head]
+        self._buf[head] = None
+        self._head = (head + 1) % self._size
+        return item
+
+
 class DataCollector:
     """Data collector object class.
     This class is used to consume event data from a serial comm port and process it by looking for acquisition frequency
@@ -64,7 +153,12 @@ class DataCollector:
                queue_save_path:
         """
         logging.basicConfig()
+        # every event is only logged at DEBUG level so the level is checked once here rather than per event
+        self._debug_event_logging: bool = logging.getLogger().isEnabledFor(logging.DEBUG)
         self._com_port = com_port
+        # a real serial port (a raw io stream) is drained a chunk at a time rather than through its readline
+        self._read_buffer = bytearray()
+        self._read_line = self._read_port_line if isinstance(com_port, io.RawIOBase) else com_port.readline
         self._saved_file_names: list = []
         self._ignore_header_size: int = kwargs.get("ignore_header_size", 0)
         self._save_dir: str = kwargs.get('save_dir', None)
@@ -72,8 +166,6 @@ class DataCollector:
             raise NotADirectoryError(f"The specified save directory {self._save_dir} does not exist.")
         self._buff_size: int = kwargs.get('buff_size', 90)
         self._window_size: int = kwargs.get('window_size', 10)
-        self._window_index = 0
-        self._window_buff_indices = [0] * self._window_size
         self._ignore_event_count = 0
         # if self._buff_size % self._window_size != 0:
         #     raise ValueError("Require buff size is an odd multiple of window size.")
@@ -88,38 +180,49 @@ class DataCollector:
         self._event_counter: int = 0
         # buffer index points to latest event entry - cycles between 0 and _buff_size -1
         self._buff_index: int = 0
-        self._look_for_start = True
 
         self._anomaly_threshold = kwargs.get("anomaly_threshold", 2.0)
+        self._anomaly_check_enabled: bool = not math.isclose(self._anomaly_threshold, 0.0)
+        # high and low anomaly frequency limits derived from the median frequency
+        self._anomaly_high: float = 0.0
+        self._anomaly_low: float = 0.0
         self._log_all_events: bool = kwargs.get('log_all_events', True)
+        # all events are appended to a single open file that is replaced every ALL_LOG_FILE_PERIOD
+        self._all_log_file = None
+        self._all_log_start_time: float = 0.0
+        # buffers to be saved are copied and queued to be written to file on a separate thread
+        self._write_queue = queue.Queue(maxsize=8)
+        self._writer_thread = None
         self._start_string: bool = kwargs.get('start_string', '')
         if self._start_string != '':
             self._look_for_start_string = True
         else:
             self._look_for_start_string = False
+        self._start_bytes: bytes = self._start_string.encode()
         self._user_id: str = kwargs.get('user_id', "")
         self._user_name = kwargs.get('user_name', "")
         self._user_password = kwargs.get('user_password', "")
         self._ip_address = kwargs.get('ip_address', "")
-        self._date_time_format: str = "%Y%m%d %H%M%S.%f"
 
-        self._shut_down: bool = False
+        self._shutdown_event = threading.Event()
         self._acquisition_ended = True
         self._remote_access_ended = True
         self._queue_save_path = kwargs.get("queue_save_path", "queue.txt")
-        self._file_queue = queue.Queue(maxsize=100)  # thread safe
+        self._file_queue = SPSCQueue()  # writer thread puts, remote thread gets
         self._suppress_timeout_message = False
         self._status: Enum = Status.NORMAL
-        self._buff = pd.DataFrame({'comp_time': pd.Series(dtype='str'),
-                                   'event': pd.Series(dtype='int'),
-                                   'arduino_time': pd.Series(dtype='int'),
-                                   'adc': pd.Series(dtype='int'),
-                                   'sipm': pd.Series(dtype='float'),
-                                   'dead_time': pd.Series(dtype='int'),
-                                   'temp': pd.Series(dtype='float'),
-                                   'win_f': pd.Series(dtype='float'),
-                                   'median_f': pd.Series(dtype='float')})
-        self._buff_date_time_start = ""
+        # event buffer is held as a set of preallocated column arrays (struct of arrays) indexed by _buff_index
+        # computer time of each event held as UTC nanoseconds since epoch and only formatted when written to file
+        self._comp_time = np.zeros(self._buff_size, dtype=np.int64)
+        self._event = np.zeros(self._buff_size, dtype=np.int64)
+        self._arduino_time = np.zeros(self._buff_size, dtype=np.int64)
+        self._adc = np.zeros(self._buff_size, dtype=np.int64)
+        self._sipm = np.zeros(self._buff_size, dtype=np.float64)
+        self._dead_time = np.zeros(self._buff_size, dtype=np.int64)
+        self._temp = np.zeros(self._buff_size, dtype=np.float64)
+        self._win_f = np.full(self._buff_size, np.nan)
+        self._median_f = np.full(self._buff_size, np.nan)
+        self._buff_time_start_ns: int = 0
         signal.signal(signal.SIGINT, self._signal_handler)
 
     def __enter__(self):
@@ -147,12 +250,25 @@ class DataCollector:
         return self._saved_file_names
 
     def _wait_for_start(self, name: str):
-        while True:
-            line = self._com_port.readline()  # Wait and read data
-            print(line, end='')
-            self._com_port.write(b'got-it')
-            if name in str(line):
-                break
+        """Wait for a line containing name, then acknowledge it once."""
+        name_bytes = name.encode()
+        while name_bytes not in self._com_port.readline():
+            pass
+        self._com_port.write(b'got-it')
+
+    def _read_port_line(self) -> bytes:
+        """Read the next line from the serial port. All bytes waiting at the port are taken with a single read and
+        split into lines here, so a burst of events costs one read. Returns b'' if no complete line is available
+        before the port read times out."""
+        newline_index = self._read_buffer.find(b'\n')
+        if newline_index < 0:
+            self._read_buffer += self._com_port.read(max(1, self._com_port.in_waiting))
+            newline_index = self._read_buffer.find(b'\n')
+            if newline_index < 0:
+                return b''
+        line = bytes(self._read_buffer[:newline_index + 1])
+        del self._read_buffer[:newline_index + 1]
+        return line
 
     def _save_queue(self):
         """Save the file queue to file."""
@@ -161,11 +277,11 @@ class DataCollector:
         logging.info(f"Saving file queue to {self._queue_save_path}...")
         file_list = []
         while not self._file_queue.empty():
-            file_list.append(self._file_queue.get() + '\n')
+            file_list.append(self._file_queue.get())
         if file_list:
             logging.info(f"{len(file_list)} file names have been preserved")
             with open(self._queue_save_path, "w") as f:
-                f.writelines(file_list)
+                f.writelines(f"{file_path}\n" for file_path in file_list)
 
     def _load_queue(self):
         """Load the file queue from file."""
@@ -178,118 +294,237 @@ class DataCollector:
                     if not os.path.exists(file_path):
                         logging.info(f"Throwing away {file_path} as it no longer exists")
                         continue
-                    self._file_queue.put(file_path)
+                    self._file_queue.requeue(file_path)
             logging.info(f"{i} files loaded")
             os.remove(self._queue_save_path)
 
-    def _copy_file_to_server(self, file_path: str) -> bool:
-        """Copy file to remote server."""
+    def _connect_to_server(self) -> FTP:
+        """Open a connection to the remote server and move to the user directory."""
+        ftp = FTP(self._ip_address, self._user_name, self._user_password)
+        if self._user_id not in ftp.nlst():
+            logging.info(f"Creating remote user directory {self._user_id}")
+            ftp.mkd(self._user_id)
+        ftp.cwd(self._user_id)
+        return ftp
+
+    @staticmethod
+    def _close_connection(ftp: FTP) -> None:
+        """Close a connection to the remote server. Does nothing if the connection has already been closed."""
+        if ftp.sock is None:
+            return
         try:
-            with FTP(self._ip_address, self._user_name, self._user_password) as ftp:
-                if self._user_id not in ftp.nlst():
-                    logging.info(f"Creating remote user directory {self._user_id}")
-                    ftp.mkd(self._user_id)
-                ftp.cwd(self._user_id)
-                with open(file_path, 'rb') as file:
-                    target_path = os.path.basename(file_path)
-                    if not os.path.exists(file_path):
-                        logging.info(f"{file_path} no longer exists and has been removed from queue")
-                        return True
-                    logging.info(f"Saving {target_path} to remote server")
-                    ftp.storbinary(f'STOR {target_path}', file)
-                    self._suppress_timeout_message = False
-            return True
-        except TimeoutError:
-            if not self._suppress_timeout_message:
-                logging.error("Timeout - unable to connect with remote FTP server")
-            self._suppress_timeout_message = True
-            return False
+            ftp.quit()
+        except ftplib.all_errors:
+            ftp.close()
+
+    def _copy_file_to_server(self, ftp: FTP, file_path: str) -> FTP:
+        """Copy file to remote server re-using the given connection if it is still open. Returns the connection used."""
+        if ftp is not None:
+            try:
+                ftp.voidcmd("NOOP")
+            except ftplib.all_errors:
+                # server has probably dropped the idle connection
+                self._close_connection(ftp)
+                ftp = None
+        if ftp is None:
+            ftp = self._connect_to_server()
+        if not os.path.exists(file_path):
+            logging.info(f"{file_path} no longer exists and has been removed from queue")
+            return ftp
+        target_path = os.path.basename(file_path)
+        logging.info(f"Saving {target_path} to remote server")
+        with open(file_path, 'rb') as file:
+            ftp.storbinary(f'STOR {target_path}', file)
+        return ftp
 
     def _process_file_queue(self):
-        """Process the file queue running on separate thread."""
+        """Process the file queue running on separate thread. A single connection to the remote server is held open
+        while files are copied and is only re-opened after an error."""
         logging.info("Remote access thread started")
         self._load_queue()
-        while True:
-            time.sleep(3)
+        ftp = None
+        while not self._shutdown_event.is_set():
             try:
-                file_path = self._file_queue.get(block=False)
-                if not self._copy_file_to_server(file_path):
-                    # unable to copy file to server so place the path back into the queue
-                    self._file_queue.put(file_path)
+                file_path = self._file_queue.get(timeout=1.0)
             except queue.Empty:
-                pass
-            if self._shut_down:
-                logging.info("Remote access thread shutting down...")
-                if not self._file_queue.empty():
-                    self._save_queue()
-                self._remote_access_ended = True
-                break
-
-    def _write_csv(self, file_path):
-        """Write event data as CSV file."""
+                continue
+            try:
+                ftp = self._copy_file_to_server(ftp, file_path)
+                self._suppress_timeout_message = False
+            except ftplib.all_errors as e:
+                # unable to copy file to server so place the path back into the queue and retry later
+                self._file_queue.requeue(file_path)
+                if not self._suppress_timeout_message:
+                    logging.error(f"Unable to copy file to remote FTP server - {e!r}")
+                self._suppress_timeout_message = True
+                if ftp is not None:
+                    self._close_connection(ftp)
+                    ftp = None
+                self._shutdown_event.wait(3)
+        logging.info("Remote access thread shutting down...")
+        if ftp is not None:
+            self._close_connection(ftp)
+        if not self._file_queue.empty():
+            self._save_queue()
+        self._remote_access_ended = True
+
+    def _copy_buff(self) -> tuple:
+        """Copy the buffer, with the buffer start event number and time, so that it can be written to file on the
+        writer thread while acquisition carries on. Columns are copied in the order they are written to file."""
+        return self._buff_start_event, self._buff_time_start_ns, tuple(
+            column.copy() for column in (self._comp_time, self._event, self._arduino_time, self._adc, self._sipm,
+                                         self._dead_time, self._temp, self._win_f, self._median_f))
+
+    def _write_csv_header(self, f, buff: tuple) -> None:
+        """Write the metadata line and column header of a copied buffer to an open CSV file."""
+        buff_start_event, buff_time_start_ns, _ = buff
+        # build from integer seconds and microseconds as float seconds since the epoch can't hold every microsecond
+        buff_date_time_start = datetime.fromtimestamp(buff_time_start_ns // 10**9, timezone.utc).replace(
+            microsecond=buff_time_start_ns // 1000 % 10**6)
+        f.write(f"{VERSION},{self._user_id},{self._buff_size},{self._window_size},"
+                f"{self._anomaly_threshold},{buff_start_event},{buff_date_time_start}\n")
+        csv.writer(f, lineterminator='\n').writerow(['comp_time', 'event', 'arduino_time', 'adc', 'sipm', 'dead_time',
+                                                     'temp', 'win_f', 'median_f'])
+
+    @staticmethod
+    def _write_csv_rows(f, buff: tuple) -> None:
+        """Write the events of a copied buffer to an open CSV file. Events are written in buffer order."""
+        comp_time, event, arduino_time, adc, sipm, dead_time, temp, win_f, median_f = buff[2]
+        # frequencies that have not been calculated are written as empty fields
+        win_f = np.where(np.isnan(win_f), None, win_f).tolist()
+        median_f = np.where(np.isnan(median_f), None, median_f).tolist()
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerows(zip(_format_comp_time(comp_time).tolist(), event.tolist(), arduino_time.tolist(),
+                             adc.tolist(), sipm.tolist(), dead_time.tolist(), temp.tolist(), win_f, median_f))
+
+    def _write_csv(self, file_path, buff: tuple):
+        """Write a copied buffer as CSV file."""
         if os.path.isfile(file_path):
             logging.info(f"File {file_path} already exists so aborting save!")
             return False
         self._saved_file_names.append(file_path)
-        with open(file_path, 'a') as f:
+        with open(file_path, 'a', newline='') as f:
             # write metadata first
-            f.write(f"{VERSION},{self._user_id},{self._buff_size},{self._window_size},"
-                    f"{self._anomaly_threshold},{self._buff_start_event},{self._buff_date_time_start}\n")
-            self._buff.to_csv(f, index=False, date_format=DATE_TIME_FORMAT, lineterminator='\n')
+            self._write_csv_header(f, buff)
+            self._write_csv_rows(f, buff)
         return True
 
-    def _save_buff(self, sub_dir=""):
-        """Save current content of buffer."""
+    def _buff_file_path(self, sub_dir: str, buff: tuple) -> str:
+        """Return the path of a new file for a copied buffer in the given save sub directory, creating the directory
+        if needed."""
         # file name is UTC of first event
-        middle_event_number = self._buff.loc[self._buff.index[int(self._buff_size / 2)], 'event']
+        middle_event_number = buff[2][1][self._buff_size // 2]
         file_name = f"{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}-{str(middle_event_number)}.csv"
         file_dir = os.path.join(self._save_dir, sub_dir)
         if not os.path.isdir(file_dir):
             logging.info(f"Creating directory {file_dir}")
             os.makedirs(file_dir)
-        file_path = os.path.join(file_dir, file_name)
+        return os.path.join(file_dir, file_name)
+
+    def _save_buff(self, sub_dir: str, buff: tuple):
+        """Save a copied buffer to its own file."""
+        file_path = self._buff_file_path(sub_dir, buff)
         logging.info(f"Saving buffer to file {file_path}")
-        if self._write_csv(file_path) and sub_dir == "anomaly":
+        if self._write_csv(file_path, buff) and sub_dir == "anomaly":
             # queue buffer file name to be saved remotely on separate thread
-            self._file_queue.put(file_path)
+            if not self._file_queue.put(file_path):
+                logging.error(f"File queue is full so {file_path} will not be copied to the remote server")
+
+    def _log_all_buff(self, buff: tuple) -> None:
+        """Append a copied buffer to the open all events file. A new file is started every ALL_LOG_FILE_PERIOD
+        seconds and only then is the metadata and column header written."""
+        now = time.monotonic()
+        if self._all_log_file is None or now - self._all_log_start_time >= ALL_LOG_FILE_PERIOD:
+            self._close_all_log_file()
+            file_path = self._buff_file_path("all", buff)
+            if os.path.isfile(file_path):
+                logging.info(f"File {file_path} already exists so aborting save!")
+                return
+            logging.info(f"Starting all events file {file_path}")
+            self._saved_file_names.append(file_path)
+            self._all_log_file = open(file_path, 'a', newline='', buffering=1 << 20)
+            self._all_log_start_time = now
+            self._write_csv_header(self._all_log_file, buff)
+        self._write_csv_rows(self._all_log_file, buff)
+        # flush each buffer so the file on disk is complete up to the latest buffer
+        self._all_log_file.flush()
+
+    def _close_all_log_file(self) -> None:
+        """Close the all events file if open."""
+        if self._all_log_file is not None:
+            self._all_log_file.close()
+            self._all_log_file = None
+
+    def _queue_buff(self, sub_dir: str) -> None:
+        """Queue a copy of the buffer to be saved to the given sub directory by the writer thread. This never blocks
+        acquisition - if the writer has fallen that far behind the buffer is not saved."""
+        try:
+            self._write_queue.put_nowait((sub_dir, self._copy_buff()))
+        except queue.Full:
+            logging.error(f"Buffer write queue is full so buffer has not been saved to {sub_dir}")
+
+    def _write_buffs(self) -> None:
+        """Write queued buffers to file running on separate thread until None is queued. A sub directory queued
+        without a buffer starts a new all events file."""
+        try:
+            while True:
+                item = self._write_queue.get()
+                if item is None:
+                    break
+                sub_dir, buff = item
+                # a failed write (e.g. disk full) loses that buffer but must not stop the writer taking from the queue
+                try:
+                    if buff is None:
+                        self._close_all_log_file()
+                    elif sub_dir == "all":
+                        self._log_all_buff(buff)
+                    else:
+                        self._save_buff(sub_dir, buff)
+                except Exception:
+                    logging.exception(f"Failed to write buffer to {sub_dir}")
+        finally:
+            self._close_all_log_file()
+
+    def _put_write_item(self, item) -> None:
+        """Queue an item that must not be dropped, blocking while the writer thread is running to take it. If the
+        writer thread is not running the item is discarded so that acquisition can never block forever."""
+        while self._writer_thread is not None and self._writer_thread.is_alive():
+            try:
+                self._write_queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+        logging.error(f"Buffer writer is not running so {item} has not been queued")
 
     def _check_for_anomaly(self, mid_frequency) -> bool:
         """Check for event anomaly."""
-        logging.debug(f"Checking mid buff[{self._mid_frequency_index}] window freq: "
-                      f"{mid_frequency:.3f} against median frequency {self._frequency_median:.3f} "
-                      f"ignore_event_count: {self._ignore_event_count }")
-        if mid_frequency > self._frequency_median * self._anomaly_threshold:
+        if self._debug_event_logging:
+            logging.debug("Checking mid buff[%d] window freq: %.3f against median frequency %.3f "
+                          "ignore_event_count: %d", self._mid_frequency_index, mid_frequency, self._frequency_median,
+                          self._ignore_event_count)
+        if mid_frequency > self._anomaly_high:
             logging.info(f"HIGH ANOMALY DETECTED at frequency {mid_frequency:.3f}")
             return True
-        if mid_frequency < self._frequency_median / self._anomaly_threshold:
+        if mid_frequency < self._anomaly_low:
             logging.info(f"LOW ANOMALY DETECTED at frequency {mid_frequency:.3f}")
             return True
         return False
 
     def _update_frequency_history(self, cur_buff_index: int) -> bool:
         """With a new window set of data available update the window event frequency history and look for anomalies."""
-        window_data = self._buff.iloc[self._window_buff_indices]
-        window_data = window_data.sort_values(by='arduino_time', ignore_index=True)
-        windows_time_start = (window_data.loc[window_data.index[0], 'arduino_time'] -
-                              window_data.loc[window_data.index[0], 'dead_time'])
-        windows_time_end = (window_data.loc[window_data.index[-1], 'arduino_time'] -
-                            window_data.loc[window_data.index[-1], 'dead_time'])
-        windows_time_diff = (windows_time_end - windows_time_start) / 1000.0
-        window_freq = len(window_data) / windows_time_diff
-
-        if self._frequency_array_full:
-            # update buffer by removing the oldest window frequency and adding latest frequency
-            self._frequency_array = np.roll(self._frequency_array, -1)
-            self._frequency_array[-1] = window_freq
-        else:
-            # first time filling of frequency array
-            self._frequency_array[self._frequency_index] = window_freq
-        # logging.debug(f"window time (s) = {windows_time_diff.total_seconds()} arduino time (s) = {arduino_time_diff} "
-        #              f"window frequency[{self._frequency_index}] = {window_freq}")
-        self._buff.loc[cur_buff_index, 'win_f'] = window_freq
+        # the window is the last window_size events in the buffer ring, ending at the current buffer index
+        first_buff_index = cur_buff_index - self._window_size + 1
+        if first_buff_index < 0:
+            first_buff_index += self._buff_size
+        window_freq = _window_frequency(self._arduino_time, self._dead_time, first_buff_index, cur_buff_index,
+                                        self._window_size)
+
+        # frequency array is a ring - once full the latest frequency overwrites the oldest at the write index
+        self._frequency_array[self._frequency_index] = window_freq
+        self._win_f[cur_buff_index] = window_freq
         self._frequency_index += 1
         if self._frequency_index == len(self._frequency_array):
-            # end of frequency array reached
+            # end of frequency array reached so wrap around
             self._frequency_index = 0
             self._frequency_array_full = True
 
@@ -298,6 +533,10 @@ class DataCollector:
     def _update_median_frequency(self):
         """Add median frequency entry to buff."""
         self._frequency_median = np.median(self._frequency_array)
+        if self._anomaly_check_enabled:
+            # anomaly limits only change with the median so calculate them here rather than for every check
+            self._anomaly_high = self._frequency_median * self._anomaly_threshold
+            self._anomaly_low = self._frequency_median / self._anomaly_threshold
         if self._frequency_median > self._max_median_frequency:
             logging.info(f"Median frequency {self._frequency_median:.3f} exceeded maximum "
                          f"{self._max_median_frequency:.3f}")
@@ -305,7 +544,7 @@ class DataCollector:
             self._status = Status.MEDIAN_FREQUENCY_EXCEEDED
             return False
         logging.info(f"buffer median frequency: {self._frequency_median:.3f}")
-        self._buff.loc[self._buff_size - 1, 'median_f'] = self._frequency_median
+        self._median_f[self._buff_size - 1] = self._frequency_median
 
     def _reset(self):
         """Reset parameters required for re-start."""
@@ -313,139 +552,160 @@ class DataCollector:
         self._frequency_array_full: bool = False
         self._event_counter: int = 0
         self._buff_index: int = 0
-        self._look_for_start = True
-        self._buff = self._buff[0:0]
+        self._win_f.fill(np.nan)
+        self._median_f.fill(np.nan)
+        # event numbers start again so begin a new all events file. Note, this must not be dropped so may block.
+        self._put_write_item(("all", None))
+
+    def _read_data_line(self):
+        """Wait for and read the next line from the serial port. Note, event lines are plain ASCII so are parsed as
+        bytes without decoding. Returns None if acquisition is to stop."""
+        while True:
+            data = self._read_line()
+            if self._shutdown_event.is_set():
+                return None
+            if data == b'':
+                continue
+            if data == b'exit':
+                logging.info("EXIT!!!")
+                return None
+            return data
 
-    def _acquire_data(self) -> None:
+    def _find_start(self):
         """
-        Main data acquisition function used to sink the data from the serial port and hold it in a queue of buffers.
-        Each buffer can hold a number of events that arrive within the specified time period. When the buffer queue is
-        full the middle buffer is checked against the max number of events trigger threshold. This is then repeated for
-        every subsequent buffer received. When a middle buffer exceeds the trigger threshold then the entire contents
-        of the buffer queue are saved.
+        Consume the lines sent by the detector before its events i.e., the start string, the header of the specified
+        size or (if neither are used) header comments. This runs once at start and again after a detector restart so
+        that none of these checks are made per event.
+        :return: The line that starts acquisition and is to be processed as the first event, b'' if the starting line
+            is not an event, or None if acquisition is to stop.
         """
-        logging.info("Acquisition thread started")
-        self._acquisition_ended = False
         header_line_count = 0
         while True:
-            # Wait for and read event data.
-            data = self._com_port.readline()
-            # print(data)
-            if data == b'':
-                continue
-            if self._shut_down:
-                break
-            try:
-                data = codecs.decode(data, 'UTF-8', errors='replace')
-            except UnicodeDecodeError as e:
-                print("--------------Decode Error-------------")
-                print(e)
-                print(data)
-                print("---------------------------------------")
-                sys.exit(0)
-
-            if data == 'exit':
-                logging.info("EXIT!!!")
-                break
-
-            if self._look_for_start:
-                if self._look_for_start_string:
-                    if data.find(self._start_string) != -1:
-                        self._look_for_start = False
-                        logging.info(f"Start string '{self._start_string}' detected - beginning acquisition...")
-                    continue
-                elif self._ignore_header_size:
-                    # strip of the initial header data lines
-                    if header_line_count < self._ignore_header_size:
-                        header_line_count += 1
-                        continue
-                    else:
-                        logging.info(f"Specified header size ({self._ignore_header_size}) consumed - "
-                                     f"beginning acquisition")
-                        self._ignore_header_size = 0
+            data = self._read_data_line()
+            if data is None:
+                return None
+            if self._look_for_start_string:
+                if self._start_bytes in data:
+                    logging.info(f"Start string '{self._start_string}' detected - beginning acquisition...")
+                    return b''
+            elif self._ignore_header_size:
+                # strip of the initial header data lines
+                if header_line_count < self._ignore_header_size:
+                    header_line_count += 1
                 else:
-                    # auto search for start i.e., ignore header comments and look for event string
-                    if "###" in data:
-                        continue
-                    if len(data.split()) < 6:
-                        continue
-                    logging.info("Event line detected - beginning acquisition")
-                    logging.info("Note, only first 10 events will be displayed if logging at INFO level...")
-                    self._look_for_start = False
-
-            if "###" in data:
-                # assume detector is re-booting
-                logging.info("Looks like detector has re-started - resetting for new acquisition...")
-                self._reset()
-                continue
-
-            data_list = data.split()
-            if len(data_list) < 6:
-                logging.info(f"Bad event line detected '{data}'")
-                continue
-            data_list = data_list[0:6]
-            data_list[0] = int(data_list[0])    # event
-            data_list[1] = int(data_list[1])    # arduino time
-            data_list[2] = int(data_list[2])    # ADC
-            data_list[3] = float(data_list[3])  # SIPM
-            data_list[4] = int(data_list[4])    # dead time
-            data_list[5] = float(data_list[5])  # temp
-            data_list.extend([pd.NA, pd.NA])
-
-            date_time_now = datetime.now(timezone.utc)
-            if self._buff_index == 0:
-                self._buff_date_time_start = date_time_now
-                self._buff_start_event = data_list[0]
-
-            data_list = [date_time_now.strftime(self._date_time_format)[:-3]] + data_list
-            if self._event_counter < 10:
-                # always log first few events
-                logging.info(data_list)
-            else:
-                logging.debug(data_list)
+                    logging.info(f"Specified header size ({self._ignore_header_size}) consumed - "
+                                 f"beginning acquisition")
+                    self._ignore_header_size = 0
+                    return data
+            # auto search for start i.e., ignore header comments and look for event string
+            elif b"###" not in data and len(data.split()) >= 6:
+                logging.info("Event line detected - beginning acquisition")
+                logging.info("Note, only first 10 events will be displayed if logging at INFO level...")
+                return data
+
+    def _process_event(self, data_list: list) -> bool:
+        """Store an event, update the window frequencies and look for anomalies. Returns False if acquisition is to
+        stop."""
+        try:
+            data_list = [int(data_list[0]),    # event
+                         int(data_list[1]),    # arduino time
+                         int(data_list[2]),    # ADC
+                         float(data_list[3]),  # SIPM
+                         int(data_list[4]),    # dead time
+                         float(data_list[5])]  # temp
+        except ValueError:
+            # field count is checked by the caller so this is a malformed number - drop the line and carry on
+            logging.info(f"Bad event line detected '{b' '.join(data_list).decode(errors='replace')}'")
+            return True
 
-            try:
-                if len(self._buff) < self._buff_size:
-                    # fill buffer for first time
-                    self._buff.loc[len(self._buff)] = data_list
-                else:
-                    # repeat filling of buffer. Note start from the beginning overwriting the oldest values
-                    self._buff.loc[self._buff_index] = data_list
-                # preserve the buff indices that reflect the latest window
-                self._window_buff_indices[self._window_index] = self._buff_index
-                self._window_index = self._window_index + 1 if self._window_index < (self._window_size - 1) else 0
-                if self._window_index == 0:
-                    self._new_anomaly_window = True
-                if self._ignore_event_count:
-                    self._ignore_event_count -= 1
-                self._event_counter += 1
-            except ValueError as e:
-                print("------------Data Buff Error------------")
-                print(e)
-                print(data_list)
-                print("---------------------------------------")
-                sys.exit(0)
-
-            if self._event_counter >= self._window_size:
-                if not self._update_frequency_history(self._buff_index):
-                    break
+        time_now_ns = time.time_ns()
+        if self._buff_index == 0:
+            self._buff_time_start_ns = time_now_ns
+            self._buff_start_event = data_list[0]
+
+        if self._event_counter < 10:
+            # always log first few events
+            logging.info(data_list)
+        elif self._debug_event_logging:
+            logging.debug(data_list)
+
+        # store event in buffer. Note once full we start from the beginning overwriting the oldest values
+        i = self._buff_index
+        self._comp_time[i] = time_now_ns
+        self._event[i] = data_list[0]
+        self._arduino_time[i] = data_list[1]
+        self._adc[i] = data_list[2]
+        self._sipm[i] = data_list[3]
+        self._dead_time[i] = data_list[4]
+        self._temp[i] = data_list[5]
+        # frequencies are cleared until calculated
+        self._win_f[i] = np.nan
+        self._median_f[i] = np.nan
+        if self._ignore_event_count:
+            self._ignore_event_count -= 1
+        self._event_counter += 1
+
+        if self._event_counter >= self._window_size:
+            if not self._update_frequency_history(self._buff_index):
+                return False
+
+        # anomaly check - skipped while ignoring the events that follow a saved anomaly
+        if self._anomaly_check_enabled and self._frequency_array_full and self._ignore_event_count == 0:
+            # write index points at the oldest frequency so offset from it to get the middle (in time) frequency
+            mid_index = self._frequency_index + self._mid_frequency_index
+            if mid_index >= self._frequency_array.size:
+                mid_index -= self._frequency_array.size
+            if self._check_for_anomaly(self._frequency_array[mid_index]):
+                if self._save_dir:
+                    self._ignore_event_count = 1 * self._window_size
+                    self._queue_buff("anomaly")
+
+        # end of buffer check - buffer index steps with the event counter so wraps without a modulo
+        self._buff_index += 1
+        if self._buff_index == self._buff_size:
+            self._buff_index = 0
+            self._update_median_frequency()
+            if self._save_dir and self._log_all_events:
+                self._queue_buff("all")
+        return True
 
-            # anomaly check
-            if not math.isclose(self._anomaly_threshold, 0.0) and self._frequency_array_full:
-                if self._check_for_anomaly(self.frequency_array[self._mid_frequency_index]):
-                    if self._save_dir and self._ignore_event_count == 0:
-                        self._ignore_event_count = 1 * self._window_size
-                        self._save_buff("anomaly")
-
-            # end of buffer check
-            self._buff_index = self._event_counter % self._buff_size
-            if self._buff_index == 0:
-                self._update_median_frequency()
-                if self._save_dir and self._log_all_events:
-                    self._save_buff("all")
-
-        logging.info("Acquisition thread shutting down...")
-        self._acquisition_ended = True
+    def _acquire_data(self) -> None:
+        """
+        Main data acquisition function used to sink the data from the serial port and hold it in a ring buffer of
+        events. Window event frequencies are calculated as each event arrives and the frequency at the middle of the
+        buffer is checked against the median frequency. When it exceeds the anomaly threshold then the entire contents
+        of the buffer are saved.
+        """
+        logging.info("Acquisition thread started")
+        self._acquisition_ended = False
+        self._writer_thread = threading.Thread(target=self._write_buffs)
+        self._writer_thread.start()
+        try:
+            # bound methods called for every line are looked up once
+            read_data_line = self._read_data_line
+            process_event = self._process_event
+            data = self._find_start()
+            while data is not None:
+                if data:
+                    # split the line and look for a header marker once, reusing both results below
+                    data_list = data.split()
+                    if b"###" in data:
+                        # assume detector is re-booting
+                        logging.info("Looks like detector has re-started - resetting for new acquisition...")
+                        self._reset()
+                        data = self._find_start()
+                        continue
+                    if len(data_list) < 6:
+                        logging.info(f"Bad event line detected '{data.decode(errors='replace')}'")
+                    elif not process_event(data_list):
+                        break
+                data = read_data_line()
+        finally:
+            # let the writer finish the queued buffers and flag the end of acquisition however the loop is left
+            logging.info("Acquisition thread shutting down...")
+            self._put_write_item(None)
+            self._writer_thread.join()
+            self._acquisition_ended = True
 
     def acquire_data(self) -> None:
         t2 = threading.Thread(target=self._acquire_data)
@@ -462,4 +722,4 @@ class DataCollector:
            blocking on com_port.readline().
         """
         logging.info('Ctrl-C detected - shutting down...')
-        self._shut_down = True
+        self._shutdown_event.set()
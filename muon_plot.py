@@ -3,7 +3,7 @@ import os.path
 import pandas as pd
 import json
 from os import listdir
-from data_collector import VERSION, DATE_TIME_FORMAT
+from data_collector import VERSION
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 from typing import Tuple
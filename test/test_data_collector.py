@@ -15,9 +15,11 @@ import numpy as np
 import pandas as pd
 import codecs
 import logging
-from data_collector import DataCollector, Status
+import queue
+import io
+from data_collector import DataCollector, Status, SPSCQueue, _window_frequency, _format_comp_time
 from muon_run import _check_config
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 import muon_plot
 
 
@@ -216,9 +218,9 @@ class DataCollectorTest(unittest.TestCase):
             self.assertEqual(dc._buff_index, window_size)
             self.assertTrue(np.allclose(dc._frequency_array[1:], np.zeros(buff_size - 1)))
             self.assertGreater(dc._frequency_array[0], 1.0)
-            self.assertEqual(dc._buff.loc[3, 'win_f'], dc._frequency_array[0])
-            start = dc._buff.loc[0, 'arduino_time'] - dc._buff.loc[0, 'dead_time']
-            finish = dc._buff.loc[window_size - 1, 'arduino_time'] - dc._buff.loc[3, 'dead_time']
+            self.assertEqual(dc._win_f[3], dc._frequency_array[0])
+            start = dc._arduino_time[0] - dc._dead_time[0]
+            finish = dc._arduino_time[window_size - 1] - dc._dead_time[3]
             freq = float(window_size) / ((finish - start) / 1000.0)
             self.assertEqual(dc._frequency_array[0], freq)
             f1 = dc.frequency_array.copy()
@@ -239,16 +241,16 @@ class DataCollectorTest(unittest.TestCase):
             self.assertGreater(dc._frequency_array[2], 1.0)
             self.assertGreater(dc._frequency_array[3], 1.0)
             self.assertGreater(dc._frequency_array[4], 1.0)
-            self.assertEqual(dc._buff.loc[4, 'win_f'], dc._frequency_array[1])
-            self.assertEqual(dc._buff.loc[5, 'win_f'], dc._frequency_array[2])
-            self.assertEqual(dc._buff.loc[6, 'win_f'], dc._frequency_array[3])
-            self.assertEqual(dc._buff.loc[7, 'win_f'], dc._frequency_array[4])
-            start = dc._buff.loc[1, 'arduino_time'] - dc._buff.loc[1, 'dead_time']
-            finish = dc._buff.loc[window_size, 'arduino_time'] - dc._buff.loc[window_size, 'dead_time']
+            self.assertEqual(dc._win_f[4], dc._frequency_array[1])
+            self.assertEqual(dc._win_f[5], dc._frequency_array[2])
+            self.assertEqual(dc._win_f[6], dc._frequency_array[3])
+            self.assertEqual(dc._win_f[7], dc._frequency_array[4])
+            start = dc._arduino_time[1] - dc._dead_time[1]
+            finish = dc._arduino_time[window_size] - dc._dead_time[window_size]
             freq = float(window_size) / ((finish - start) / 1000.0)
             self.assertEqual(dc._frequency_array[1], freq)
-            start = dc._buff.loc[2, 'arduino_time'] - dc._buff.loc[2, 'dead_time']
-            finish = dc._buff.loc[window_size + 1, 'arduino_time'] - dc._buff.loc[window_size + 1, 'dead_time']
+            start = dc._arduino_time[2] - dc._dead_time[2]
+            finish = dc._arduino_time[window_size + 1] - dc._dead_time[window_size + 1]
             freq = float(window_size) / ((finish - start) / 1000.0)
             self.assertEqual(dc._frequency_array[2], freq)
             f2 = dc.frequency_array.copy()
@@ -274,15 +276,15 @@ class DataCollectorTest(unittest.TestCase):
             self.assertEqual(dc._frequency_array[9], 0.0)
             self.assertEqual(dc._frequency_array[10], 0.0)
             self.assertEqual(dc._frequency_array[11], 0.0)
-            self.assertEqual(dc._buff.loc[8, 'win_f'], dc._frequency_array[5])
-            self.assertEqual(dc._buff.loc[9, 'win_f'], dc._frequency_array[6])
-            self.assertEqual(dc._buff.loc[10, 'win_f'], dc._frequency_array[7])
-            self.assertEqual(dc._buff.loc[11, 'win_f'], dc._frequency_array[8])
+            self.assertEqual(dc._win_f[8], dc._frequency_array[5])
+            self.assertEqual(dc._win_f[9], dc._frequency_array[6])
+            self.assertEqual(dc._win_f[10], dc._frequency_array[7])
+            self.assertEqual(dc._win_f[11], dc._frequency_array[8])
             f3 = dc.frequency_array.copy()
 
-            # Collect another 1 window lengths (now 4 in total) which means we should have shifted the frequency array
-            # once to the left with latest value now always being on the right end. The event buffer is filling from the
-            # start again so these events will occupy the first 4 locations.
+            # Collect another 1 window lengths (now 4 in total) which means the frequency array write index should
+            # have wrapped around with the latest value overwriting the oldest at the start of the array. The event
+            # buffer is filling from the start again so these events will occupy the first 4 locations.
             self.max_events_to_be_processed = 4 * window_size
             dc.acquire_data()
             while not dc.processing_ended:
@@ -290,29 +292,23 @@ class DataCollectorTest(unittest.TestCase):
             self.assertEqual(dc.event_counter, self.max_events_to_be_processed)
             self.assertEqual(dc._buff_index, 4)
             self.assertEqual(dc._frequency_index, 1)
-            # remember that the frequency array shifts to the left
-            self.assertEqual(dc._frequency_array[0], f3[1])
-            self.assertEqual(dc._frequency_array[1], f3[2])
-            self.assertEqual(dc._frequency_array[2], f3[3])
-            self.assertEqual(dc._frequency_array[3], f3[4])
-            self.assertEqual(dc._frequency_array[4], f3[5])
-            self.assertEqual(dc._frequency_array[5], f3[6])
-            self.assertEqual(dc._frequency_array[6], f3[7])
-            self.assertEqual(dc._frequency_array[7], f3[8])
-            self.assertGreater(dc._frequency_array[8], 1.0)
+            # remember that the frequency array is a ring so only the oldest value has been overwritten
+            for i in range(1, 9):
+                self.assertEqual(dc._frequency_array[i], f3[i])
+            self.assertGreater(dc._frequency_array[0], 1.0)
             self.assertGreater(dc._frequency_array[9], 1.0)
             self.assertGreater(dc._frequency_array[10], 1.0)
             self.assertGreater(dc._frequency_array[11], 1.0)
-            self.assertEqual(dc._buff.loc[0, 'win_f'], dc._frequency_array[8])
-            self.assertEqual(dc._buff.loc[1, 'win_f'], dc._frequency_array[9])
-            self.assertEqual(dc._buff.loc[2, 'win_f'], dc._frequency_array[10])
-            self.assertEqual(dc._buff.loc[3, 'win_f'], dc._frequency_array[11])
-            self.assertEqual(dc._buff.loc[0, 'event'], buff_size + 1)
-            start = dc._buff.loc[0, 'arduino_time'] - dc._buff.loc[0, 'dead_time']
-            self.assertEqual(dc._buff.loc[window_size - 1, 'event'], buff_size + window_size)
-            finish = dc._buff.loc[window_size - 1, 'arduino_time'] - dc._buff.loc[window_size - 1, 'dead_time']
+            self.assertEqual(dc._win_f[0], dc._frequency_array[9])
+            self.assertEqual(dc._win_f[1], dc._frequency_array[10])
+            self.assertEqual(dc._win_f[2], dc._frequency_array[11])
+            self.assertEqual(dc._win_f[3], dc._frequency_array[0])
+            self.assertEqual(dc._event[0], buff_size + 1)
+            start = dc._arduino_time[0] - dc._dead_time[0]
+            self.assertEqual(dc._event[window_size - 1], buff_size + window_size)
+            finish = dc._arduino_time[window_size - 1] - dc._dead_time[window_size - 1]
             freq = float(window_size) / ((finish - start) / 1000.0)
-            self.assertEqual(dc._frequency_array[-1], freq)
+            self.assertEqual(dc._frequency_array[dc._frequency_index - 1], freq)
             f4 = dc.frequency_array.copy()
 
             # Collect another 2 events.
@@ -322,29 +318,23 @@ class DataCollectorTest(unittest.TestCase):
                 sleep(0.01)
             self.assertEqual(dc.event_counter, self.max_events_to_be_processed)
             self.assertEqual(dc._buff_index, 6)
-            # remember that the frequency array shifts to the left
-            self.assertEqual(dc._frequency_array[0], f4[2])
-            self.assertEqual(dc._frequency_array[1], f4[3])
-            self.assertEqual(dc._frequency_array[2], f4[4])
-            self.assertEqual(dc._frequency_array[3], f4[5])
-            self.assertEqual(dc._frequency_array[4], f4[6])
-            self.assertEqual(dc._frequency_array[5], f4[7])
-            self.assertEqual(dc._frequency_array[6], f4[8])
-            self.assertEqual(dc._frequency_array[7], f4[9])
-            self.assertEqual(dc._frequency_array[8], f4[10])
-            self.assertEqual(dc._frequency_array[9], f4[11])
-            self.assertEqual(dc._buff.loc[0, 'win_f'], dc._frequency_array[6])
-            self.assertEqual(dc._buff.loc[1, 'win_f'], dc._frequency_array[7])
-            self.assertEqual(dc._buff.loc[2, 'win_f'], dc._frequency_array[8])
-            self.assertEqual(dc._buff.loc[3, 'win_f'], dc._frequency_array[9])
-            self.assertEqual(dc._buff.loc[4, 'win_f'], dc._frequency_array[10])
-            self.assertEqual(dc._buff.loc[5, 'win_f'], dc._frequency_array[11])
-            self.assertEqual(dc._buff.loc[6, 'win_f'], dc._frequency_array[0])
-            self.assertEqual(dc._buff.loc[7, 'win_f'], dc._frequency_array[1])
-            self.assertEqual(dc._buff.loc[8, 'win_f'], dc._frequency_array[2])
-            self.assertEqual(dc._buff.loc[9, 'win_f'], dc._frequency_array[3])
-            self.assertEqual(dc._buff.loc[10, 'win_f'], dc._frequency_array[4])
-            self.assertEqual(dc._buff.loc[11, 'win_f'], dc._frequency_array[5])
+            self.assertEqual(dc._frequency_index, 3)
+            # remember that the frequency array is a ring so only the next 2 oldest values have been overwritten
+            self.assertEqual(dc._frequency_array[0], f4[0])
+            for i in range(3, 12):
+                self.assertEqual(dc._frequency_array[i], f4[i])
+            self.assertEqual(dc._win_f[0], dc._frequency_array[9])
+            self.assertEqual(dc._win_f[1], dc._frequency_array[10])
+            self.assertEqual(dc._win_f[2], dc._frequency_array[11])
+            self.assertEqual(dc._win_f[3], dc._frequency_array[0])
+            self.assertEqual(dc._win_f[4], dc._frequency_array[1])
+            self.assertEqual(dc._win_f[5], dc._frequency_array[2])
+            self.assertEqual(dc._win_f[6], dc._frequency_array[3])
+            self.assertEqual(dc._win_f[7], dc._frequency_array[4])
+            self.assertEqual(dc._win_f[8], dc._frequency_array[5])
+            self.assertEqual(dc._win_f[9], dc._frequency_array[6])
+            self.assertEqual(dc._win_f[10], dc._frequency_array[7])
+            self.assertEqual(dc._win_f[11], dc._frequency_array[8])
 
     def test_median_frequency(self):
         """Test the calculation of median on filling the frequency array."""
@@ -373,6 +363,71 @@ class DataCollectorTest(unittest.TestCase):
             expected_median = np.median(dc.frequency_array)
             self.assertEqual(dc._frequency_median, expected_median)
 
+    def test_window_frequency(self):
+        """Test window frequency from live time end points, including a window with no live time."""
+        arduino_time = np.array([100, 350, 1100], dtype=np.int64)
+        dead_time = np.array([0, 50, 100], dtype=np.int64)
+        self.assertAlmostEqual(_window_frequency(arduino_time, dead_time, 0, 2, 3), 3 / 0.9)
+        arduino_time[2] = 200
+        self.assertEqual(_window_frequency(arduino_time, dead_time, 0, 2, 3), np.inf)
+
+    def test_format_comp_time(self):
+        """Test computer time formatting matches strftime truncated to milliseconds."""
+        comp_time = np.array([0, 1_700_000_000_123_456_789, 1_700_000_059_999_999_999], dtype=np.int64)
+        expected = pd.to_datetime(comp_time, unit='ns', utc=True).strftime("%Y%m%d %H%M%S.%f").str[:-3]
+        self.assertListEqual(_format_comp_time(comp_time).tolist(), list(expected))
+
+    def test_write_csv_header_start_time(self):
+        """Test the buffer start time in the metadata line keeps every microsecond of the event time."""
+        dc = DataCollector(self.mock_com_port)
+        f = io.StringIO()
+        dc._write_csv_header(f, (1, 1_760_000_000_123_456_789, ()))
+        self.assertTrue(f.getvalue().split("\n")[0].endswith(",2025-10-09 08:53:20.123456+00:00"))
+
+    def test_spsc_queue(self):
+        """Test the single producer, single consumer queue ordering, capacity and requeue."""
+        q = SPSCQueue(4)
+        self.assertTrue(q.empty())
+        self.assertRaises(queue.Empty, q.get, timeout=0.01)
+        for i in range(3):
+            self.assertTrue(q.put(i))
+        self.assertFalse(q.put(3))
+        self.assertEqual(q.get(), 0)
+        q.requeue(0)
+        self.assertTrue(q.put(3))
+        self.assertEqual([q.get(timeout=0.01) for _ in range(4)], [0, 1, 2, 3])
+        self.assertTrue(q.empty())
+
+    def test_read_port_line(self):
+        """Test lines are split from chunked serial port reads, including partial lines and bursts."""
+        class FakePort(io.RawIOBase):
+            def __init__(self, chunks):
+                self._chunks = chunks
+
+            @property
+            def in_waiting(self):
+                return len(self._chunks[0]) if self._chunks else 0
+
+            def read(self, size=-1):
+                return self._chunks.pop(0) if self._chunks else b''
+
+        port = FakePort([b"1 10 300", b" 400 100 25.1\n2 20", b"0 300 400 200 25.1\n3 300 300 400 300 25.1\n"])
+        dc = DataCollector(port)
+        self.assertEqual(dc._read_line(), b'')
+        self.assertEqual(dc._read_line(), b"1 10 300 400 100 25.1\n")
+        self.assertEqual(dc._read_line(), b"2 200 300 400 200 25.1\n")
+        self.assertEqual(dc._read_line(), b"3 300 300 400 300 25.1\n")
+        self.assertEqual(dc._read_line(), b'')
+
+    def test_wait_for_start(self):
+        """Test waiting for the start name reads up to the matching line and acknowledges once."""
+        port = Mock()
+        port.readline.side_effect = [b"### header\n", b"junk\n", b"starting muon run\n", b"1 10 300 400 100 25.1\n"]
+        dc = DataCollector(port)
+        dc._wait_for_start("muon")
+        self.assertEqual(port.readline.call_count, 3)
+        port.write.assert_called_once_with(b'got-it')
+
     def test_data_collector_exceed_max_median_frequency(self):
         """Test data collector exits due to high median frequency detected."""
         self._load_data("./data/event_test_set2.csv")
@@ -516,11 +571,13 @@ class DataCollectorTest(unittest.TestCase):
                     sleep(0.01)
                 self.assertTrue(os.path.isdir(os.path.join(temp_dir, "anomaly")))
                 self.assertTrue(os.path.isdir(os.path.join(temp_dir, "all")))
-                # We should have 4 log all buffers + 1 low anomaly buffer + 1 high anomaly crossing 2 buffers
-                self.assertEqual(len(data_collector.saved_file_names), 6)
+                # We should have 1 all events file holding 4 buffers + 1 high anomaly buffer + 1 low anomaly buffer
+                self.assertEqual(len(data_collector.saved_file_names), 3)
                 file_path = os.path.join(temp_dir, "all", data_collector.saved_file_names[0])
-                df = pd.read_csv(file_path, skiprows=1)
                 self.assertTrue(os.path.isfile(file_path))
+                df_all = pd.read_csv(file_path, skiprows=1)
+                # metadata and header are only written once so check the first buffer held in the file
+                df = df_all.iloc[:buff_size]
                 # confirm we have window frequencies at required positions
                 states = df['win_f'].notna()
                 self.assertTrue(np.array_equal(np.where(states)[0], np.arange(window_size - 1, buff_size)))
@@ -533,34 +590,96 @@ class DataCollectorTest(unittest.TestCase):
                 median_f_array = df[df['median_f'].notna()]['median_f'].values
                 self.assertEqual(median_f_array.size, 1)
                 self.assertAlmostEqual(np.median(win_f_array), median_f_array[0])
-                # load the all files in the order that they were saved and check event column is contiguous
+                # check the all file holds every event contiguously
                 directory = os.path.join(temp_dir, "all")
                 file_list = [file for file in os.listdir(directory) if file.endswith('csv')]
-                self.assertEqual(len(file_list), 4)
-                # note index 3 is the anomaly file
-                for i in [0, 1, 3, 5]:
-                    file = data_collector.saved_file_names[i]
-                    df = pd.read_csv(file, skiprows=1)
-                    if i == 0:
-                        df_all = pd.read_csv(file, skiprows=1)
-                    else:
-                        df_all = pd.concat([df_all, df], ignore_index=True)
+                self.assertEqual(len(file_list), 1)
                 self.assertListEqual(df_all['event'].tolist(), list(range(1, 121)))
                 # test high event file
-                file = data_collector.saved_file_names[2]
+                file = data_collector.saved_file_names[1]
                 df_anomaly = pd.read_csv(file, skiprows=1)
                 self.assertNotEqual(df_anomaly['event'].tolist(), list(range(57, 87)))
                 # sort them by date/time
                 df_anomaly = df_anomaly.sort_values(by='arduino_time', ignore_index=True)
                 self.assertListEqual(df_anomaly['event'].tolist(), list(range(57, 87)))
                 # test low event file
-                file = data_collector.saved_file_names[4]
+                file = data_collector.saved_file_names[2]
                 df_anomaly = pd.read_csv(file, skiprows=1)
                 self.assertNotEqual(df_anomaly['event'].tolist(), list(range(90, 120)))
                 # sort them by date/time
                 df_anomaly = df_anomaly.sort_values(by='arduino_time', ignore_index=True)
                 self.assertListEqual(df_anomaly['event'].tolist(), list(range(90, 120)))
 
+    def test_data_collector_log_all_events_restart(self):
+        """Test a detector restart begins a new all events file."""
+        self._load_data("./data/event_test_set2.csv")
+        self.data.insert(60, b"### detector restarted")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with DataCollector(self.mock_com_port,
+                               save_dir=temp_dir,
+                               buff_size=30,
+                               window_size=10,
+                               log_all_events=True,
+                               anomaly_threshold=0.0,
+                               ignore_header_size=0,
+                               max_median_frequency=15.0) as data_collector:
+                data_collector.acquire_data()
+                while not data_collector.processing_ended:
+                    sleep(0.01)
+                self.assertEqual(len(data_collector.saved_file_names), 2)
+                for file, events in zip(data_collector.saved_file_names, [range(1, 61), range(61, 121)]):
+                    df = pd.read_csv(file, skiprows=1)
+                    self.assertListEqual(df['event'].tolist(), list(events))
+
+    def test_data_collector_write_error(self):
+        """Test a failed buffer write is logged and later buffers are still written."""
+        self._load_data("./data/event_test_set2.csv")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with DataCollector(self.mock_com_port,
+                               save_dir=temp_dir,
+                               buff_size=30,
+                               window_size=10,
+                               log_all_events=True,
+                               anomaly_threshold=0.0,
+                               ignore_header_size=0,
+                               max_median_frequency=15.0) as data_collector:
+                log_all_buff = data_collector._log_all_buff
+                errors = [OSError("disk full")]
+
+                def _failing_log_all_buff(buff):
+                    if errors:
+                        raise errors.pop()
+                    log_all_buff(buff)
+
+                data_collector._log_all_buff = _failing_log_all_buff
+                data_collector.acquire_data()
+                for _ in range(1000):
+                    if data_collector.processing_ended:
+                        break
+                    sleep(0.01)
+                self.assertTrue(data_collector.processing_ended)
+                self.assertEqual(len(data_collector.saved_file_names), 1)
+                df = pd.read_csv(data_collector.saved_file_names[0], skiprows=1)
+                self.assertListEqual(df['event'].tolist(), list(range(31, 121)))
+            # with no writer thread running items are dropped rather than blocking
+            data_collector._put_write_item(None)
+
+    def test_data_collector_bad_event_line(self):
+        """Test event lines with a malformed number are dropped without stopping acquisition."""
+        self._load_data("./data/event_test_set2.csv")
+        # all lines bar the final exit are events
+        event_count = len(self.data) - 1
+        self.data.insert(40, b"41 12x34 300 400 100 25.1 Dave")
+        with DataCollector(self.mock_com_port,
+                           buff_size=30,
+                           window_size=10,
+                           ignore_header_size=0,
+                           max_median_frequency=15.0) as data_collector:
+            data_collector.acquire_data()
+            while not data_collector.processing_ended:
+                sleep(0.01)
+            self.assertEqual(data_collector.event_counter, event_count)
+
     def test_data_collector_no_save_events(self):
         """Test that no files are saved if not setting save_dir."""
         self._load_data("./data/event_test_set2.csv")
@@ -695,10 +814,66 @@ class DataCollectorTest(unittest.TestCase):
                 # Tell remaining thread (remote process) to shut down. Note remote thread will probably still be
                 # blocked trying to FTP a file extracted from the queue at this point. Eventually this will time
                 # out and be reinstated to the queue before saving its content.
-                dc._shut_down = True
+                dc._shutdown_event.set()
                 sleep(20)
                 self.assertTrue(queue_save_path)
 
+    def test_file_queue_reconnect_fails(self):
+        """Test remote thread survives the held FTP connection dropping and the reconnect failing."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_paths = []
+            for i in range(2):
+                file_path = os.path.join(temp_dir, f"file_{i}.csv")
+                with open(file_path, 'w') as f:
+                    f.write("a")
+                file_paths.append(file_path)
+            queue_save_path = os.path.join(temp_dir, "queue.txt")
+
+            # held connection that the server drops after the first file is copied
+            stale_ftp = Mock()
+            stale_ftp.sock = Mock()
+            stale_ftp.nlst.return_value = [""]
+            stale_ftp.voidcmd.side_effect = EOFError
+
+            def close():
+                stale_ftp.sock = None
+
+            def quit_ftp():
+                if stale_ftp.sock is None:
+                    raise AttributeError("'NoneType' object has no attribute 'sendall'")
+                raise EOFError
+            stale_ftp.close.side_effect = close
+            stale_ftp.quit.side_effect = quit_ftp
+            connections = []
+
+            def connect(*args):
+                connections.append(args)
+                if len(connections) == 1:
+                    return stale_ftp
+                raise OSError("Network is unreachable")
+
+            with patch("data_collector.FTP", side_effect=connect):
+                with DataCollector(self.mock_com_port,
+                                   save_dir=temp_dir,
+                                   ip_address="1.2.3.4",
+                                   queue_save_path=queue_save_path) as dc:
+                    for file_path in file_paths:
+                        dc._file_queue.put(file_path)
+                    dc.run_remote()
+                    for _ in range(100):
+                        if len(connections) > 1:
+                            break
+                        sleep(0.01)
+                    dc._shutdown_event.set()
+                    for _ in range(500):
+                        if dc._remote_access_ended:
+                            break
+                        sleep(0.01)
+                    self.assertTrue(dc._remote_access_ended)
+            stale_ftp.storbinary.assert_called_once()
+            with open(queue_save_path) as f:
+                self.assertEqual(f.read(), f"{file_paths[1]}\n")
+
     def test_add_datetime_column(self):
         """Test add datetime column function."""
         start_event = 5